@@ -1,5 +1,9 @@
+from collections import defaultdict
+from functools import cache
 from pathlib import Path
 
+import numpy as np
+
 # 1. FILE PATHS & SYSTEM SETTINGS
 PROJECT_DIR = Path(__file__).resolve().parent.parent
 RANDOM_SEED = 222
@@ -9,6 +13,15 @@ DATA_DIR = PROJECT_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
 OD_FILE_TEMPLATE = "date-hour-soo-dest-{year}.csv.gz"
 OD_FILE_COLUMNS = ["date", "hour", "origin", "dest", "count"]
+# Narrow dtypes for the OD file; station codes repeat millions of times
+# Dates are parsed by the CSV reader itself (parse_dates is far slower with pyarrow)
+OD_FILE_DTYPES = {
+    "date": "datetime64[s]",
+    "hour": "int8",
+    "origin": "category",
+    "dest": "category",
+    "count": "int32",
+}
 
 # What year should we use?
 TARGET_YEAR = 2024
@@ -17,6 +30,11 @@ OD_FILEPATH = DATA_DIR / OD_FILE_TEMPLATE.format(year=TARGET_YEAR)
 # play around with this value
 DEMAND_MULTIPLIER = 1.0
 
+# The network plots reuse a precomputed station layout, cached here per network shape
+LAYOUT_CACHE_TEMPLATE = "layout-{key}.pkl"
+# Same for the OD shortest-path lookup, per routing graph
+PATH_CACHE_TEMPLATE = "paths-{key}.pkl"
+
 # In case we need to download it, here's where we get it from
 OD_URL_TEMPLATE = "https://afcweb.bart.gov/ridership/origin-destination/date-hour-soo-dest-{year}.csv.gz"
 # 2. TIME & SCOPE
@@ -29,6 +47,8 @@ PERIOD_TO_HOURS = {
     "PM": [15, 16, 17, 18],
     "EVE": [19, 20, 21],
 }
+# Length of each period in hours
+PERIOD_HOURS = {period: len(hours) for period, hours in PERIOD_TO_HOURS.items()}
 
 
 # 3. PHYSICAL CONSTANTS
@@ -40,6 +60,11 @@ POSSIBLE_TRAIN_LENGTHS = list(range(3, 11))  # [3, 4, ..., 10]
 MIN_FREQ = 2  # Max gap ~30 mins
 MAX_FREQ = 12  # Min gap ~5 mins
 
+# How much unmet demand (pax/hr) the cost objective may give up, relative to the best
+# achievable: max(UNMET_ABS_TOL, UNMET_REL_TOL * minimum unmet)
+UNMET_ABS_TOL = 1e-4
+UNMET_REL_TOL = 1e-5
+
 # 4. NETWORK DEFINITIONS
 # This part is used by routing.py to map the OD data into segment specific capacities
 # Since we're doing this dynamically (calculating shortest paths between stations,
@@ -227,6 +252,22 @@ LINES = {
     "OAK": ["COLS", "OAKL"],
 }
 
+# Dense integer id per station (fits in a uint8), for array-based lookups
+STATION_ID = {s: i for i, s in enumerate(STATIONS)}
+
+# Which lines serve each station, and each directed segment (u, v) between adjacent
+# stations. LINES never changes at runtime, so these are derived once, here
+STATION_TO_LINES = {
+    s: frozenset(ln for ln, seq in LINES.items() if s in seq) for s in STATIONS
+}
+
+_segment_lines = defaultdict(set)
+for ln, seq in LINES.items():
+    for u, v in zip(seq, seq[1:]):
+        _segment_lines[(u, v)].add(ln)
+        _segment_lines[(v, u)].add(ln)
+SEGMENT_TO_LINES = {seg: frozenset(lns) for seg, lns in _segment_lines.items()}
+
 # The lines we actually optimize (excluding the OAK shuttle)
 MODEL_LINES = ["RED", "ORANGE", "YELLOW", "GREEN", "BLUE"]
 DIRS = ["FWD", "REV"]
@@ -255,23 +296,48 @@ ROUND_TRIP_HOURS = {
 }
 
 # Status Quo Frequencies (Trains/hr) - For comparison only
-# (Line, Direction, Period) -> Frequency
-BASELINE_FREQUENCIES = {}
+# Stored as an int8 array indexed [line, direction, period] via the *_IDX maps
+LINE_IDX = {ln: i for i, ln in enumerate(MODEL_LINES)}
+DIR_IDX = {dr: i for i, dr in enumerate(DIRS)}
+PERIOD_IDX = {p: i for i, p in enumerate(PERIODS)}
+
+BASELINE_FREQ_ARR = np.zeros((len(MODEL_LINES), len(DIRS), len(PERIODS)), dtype=np.int8)
 for ln in MODEL_LINES:
-    for dr in DIRS:
-        BASELINE_FREQUENCIES[(ln, dr, "AM")] = 6 if ln == "YELLOW" else 4
-        BASELINE_FREQUENCIES[(ln, dr, "MID")] = 4 if ln == "YELLOW" else 3
-        BASELINE_FREQUENCIES[(ln, dr, "PM")] = 6 if ln == "YELLOW" else 4
-        BASELINE_FREQUENCIES[(ln, dr, "EVE")] = 2
+    # Same frequency in both directions
+    BASELINE_FREQ_ARR[LINE_IDX[ln], :, PERIOD_IDX["AM"]] = 6 if ln == "YELLOW" else 4
+    BASELINE_FREQ_ARR[LINE_IDX[ln], :, PERIOD_IDX["MID"]] = 4 if ln == "YELLOW" else 3
+    BASELINE_FREQ_ARR[LINE_IDX[ln], :, PERIOD_IDX["PM"]] = 6 if ln == "YELLOW" else 4
+    BASELINE_FREQ_ARR[LINE_IDX[ln], :, PERIOD_IDX["EVE"]] = 2
+
+# (Line, Direction, Period) -> Frequency, read off the array above
+BASELINE_FREQUENCIES = {
+    (ln, dr, p): int(BASELINE_FREQ_ARR[LINE_IDX[ln], DIR_IDX[dr], PERIOD_IDX[p]])
+    for ln in MODEL_LINES
+    for dr in DIRS
+    for p in PERIODS
+}
 
 # ==============================
 # FUNCTIONS
 # ==============================
 
 
+@cache
 def hours_to_periods():
+    # PERIOD_TO_HOURS is fixed, so the map is built once and shared; don't mutate it
     hour_to_period = {}
     for period, hours in PERIOD_TO_HOURS.items():
         for h in hours:
             hour_to_period[h] = period
     return hour_to_period
+
+
+@cache
+def hour_period_codes():
+    # Code of each hour's period (its position in PERIOD_TO_HOURS), -1 for hours in
+    # no period. Indexed by hour of the day, plus a trailing -1 that hours past the
+    # end of the day can be clipped to. Shared like hours_to_periods; don't mutate it
+    codes = np.full(25, -1, dtype=np.int8)
+    for code, hours in enumerate(PERIOD_TO_HOURS.values()):
+        codes[hours] = code
+    return codes
@@ -1,11 +1,18 @@
 import logging
 import sys
 
+# Loggers configured by setup_logger, so set_global_log_level only touches those
+_CONFIGURED_LOGGERS: list[logging.Logger] = []
+
 
 def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
     """
     Configure and return a logger instance with consistent formatting.
 
+    Log calls should pass their arguments separately, as in
+    `logger.debug("Built %s paths", n)`, rather than pre-formatting an f-string, so no
+    string is built when the level is disabled.
+
     Args:
         name: Logger name (typically __name__)
         level: Logging level ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
@@ -24,9 +31,9 @@ def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
     if logger.handlers:
         return logger
 
-    # Create console handler
+    # Create console handler. It has no level of its own: the logger's level decides
+    # what gets through, so changing verbosity is a single setLevel on the logger
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
 
     # Create formatter
     formatter = logging.Formatter(
@@ -38,6 +45,11 @@ def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
     # Add handler to logger
     logger.addHandler(console_handler)
 
+    # This logger prints through its own handler, so don't also pass records up to the
+    # root logger, where they'd be formatted (and possibly printed) a second time
+    logger.propagate = False
+
+    _CONFIGURED_LOGGERS.append(logger)
     return logger
 
 
@@ -51,8 +63,7 @@ def set_global_log_level(level: str):
     log_level = getattr(logging, level.upper(), logging.INFO)
     logging.getLogger().setLevel(log_level)
 
-    # Update all existing loggers
-    for logger_name in logging.Logger.manager.loggerDict:
-        logging.getLogger(logger_name).setLevel(log_level)
-        for handler in logging.getLogger(logger_name).handlers:
-            handler.setLevel(log_level)
+    # Loggers from setup_logger don't propagate and carry their own level, so update
+    # them directly. Everything else inherits from the root logger
+    for logger in _CONFIGURED_LOGGERS:
+        logger.setLevel(log_level)
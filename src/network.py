@@ -1,73 +1,131 @@
-from collections import defaultdict
-from dataclasses import dataclass
+import hashlib
+import pickle
+from array import array
+from functools import cache, cached_property
+from itertools import permutations
+from sys import intern
+from typing import NamedTuple
 
 import networkx as nx
-import plotly.graph_objects as go
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
-import config
+import src.config as config
+from src.logging_config import setup_logger
 
+logger = setup_logger(__name__)
 
-# Use dataclasses to represent reused concepts in the code
-@dataclass(frozen=True)
-class LineDirection:
+# Marker in BartNetwork.dist for node pairs with no path between them
+UNREACHABLE = np.iinfo(np.int16).max
+
+
+# Use NamedTuples to represent reused concepts in the code. They are plain tuples
+# underneath, so hashing and equality (they're used as dict keys) take the C tuple path
+class LineDirection(NamedTuple):
     line: str
     direction: str  # "FWD" or "REV"
 
 
-@dataclass(frozen=True)
-class Segment:
+class Segment(NamedTuple):
     u: str
     v: str
 
     def __repr__(self):
         return f"{self.u}->{self.v}"
 
-    def __eq__(self, value: object, /) -> bool:
-        return self.u == value.u and self.v == value.v
+
+def _interleave(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Plotly draws many disconnected segments in one trace when the points come as
+    [start, end, None, start, end, None, ...]. Builds that array for one axis.
+    """
+    coords = np.empty(3 * len(starts), dtype=object)
+    coords[0::3] = starts
+    coords[1::3] = ends
+    coords[2::3] = None
+    return coords
+
+
+def _segment_coords(pos, pairs) -> tuple[np.ndarray, np.ndarray]:
+    """Plotly-ready x and y arrays for a list of (u, v) station pairs."""
+    starts = np.array([pos[u] for u, _ in pairs], dtype=float).reshape(-1, 2)
+    ends = np.array([pos[v] for _, v in pairs], dtype=float).reshape(-1, 2)
+    return _interleave(starts[:, 0], ends[:, 0]), _interleave(starts[:, 1], ends[:, 1])
 
 
 class BartNetwork:
     """A object representing the BART network"""
 
+    # segments_by_line only depends on config.LINES, so every instance shares it
+    _SEGMENTS_CACHE: dict[int, dict[LineDirection, tuple[Segment, ...]]] = {}
+
     def __init__(self):
         self.stations = config.STATIONS
         self.lines = config.LINES
-        self.station_set = set(self.stations)
+        # Only ever read, for membership tests
+        self.station_set = frozenset(self.stations)
+
+        # Every builder below works off the same (line, u, v) track segments, so walk
+        # the line sequences once and share the result
+        line_segments = list(self._iter_segments())
 
         # Build the graphs
-        self.graph = self._build_physical_graph()
-        self.routing_graph = self._build_routing_graph()
+        self.graph = self._build_physical_graph(line_segments)
+
+        # The routing graph is kept as a CSR adjacency matrix over dense integer ids,
+        # where routing_nodes[i] is the (Station, Line) node behind id i
+        self.routing_nodes, self.routing_csr = self._build_routing_graph(line_segments)
+        self.node_ids = {node: i for i, node in enumerate(self.routing_nodes)}
 
         # segments_by_line is a useful lookup dictionary, so we can ask the question
         # "which segments belong to RED FWD?" and we get all segments involved in the
         # forward direction for the red line
-        self.segments_by_line = self._get_segments_by_line()
+        cache_key = id(self.lines)
+        if cache_key not in BartNetwork._SEGMENTS_CACHE:
+            BartNetwork._SEGMENTS_CACHE[cache_key] = self._get_segments_by_line(
+                line_segments
+            )
+        self.segments_by_line = BartNetwork._SEGMENTS_CACHE[cache_key]
+
+        # The same lookup as (n_segments x 2) uint8 arrays of config.STATION_ID, for
+        # code that wants to work on segments as arrays instead of Python objects
+        self.segments_by_line_arr = {
+            key: np.array(
+                [[config.STATION_ID[u], config.STATION_ID[v]] for u, v in segs],
+                dtype=np.uint8,
+            ).reshape(-1, 2)
+            for key, segs in self.segments_by_line.items()
+        }
+
+    def _iter_segments(self):
+        """Yields (line, u, v) for every pair of consecutive stations on every line.
+
+        Station codes are interned so that equal segments share the same strings.
+        """
+        for ln, seq in self.lines.items():
+            for u, v in zip(seq, seq[1:]):
+                yield ln, intern(u), intern(v)
 
-    def _build_physical_graph(self) -> nx.Graph:
+    def _build_physical_graph(self, line_segments) -> nx.Graph:
         """Builds a simple undirected graph of the BART physical track.
-        Edges store which lines run on them: {'lines': {'RED', 'YELLOW'}}
+        Edges store which lines run on them: {'lines': frozenset({'RED', 'YELLOW'})}
+        The sets are read-only, and shared with config.SEGMENT_TO_LINES.
 
         E.g.: `(MCAR, 19TH, lines=["RED", "YELLOW", "ORANGE"])` implies that the segment
         from Macarthur to 19th St has three possible lines - red, yellow, and orange.
         """
+        # A segment shared by several lines shows up more than once, but it is the same
+        # edge with the same lines, which come precomputed from config
         G = nx.Graph()
-
-        # iterate through all the LINES in config
-        for ln, seq in self.lines.items():
-            for i in range(len(seq) - 1):
-                # pick out the two consecutive stations in this line
-                u, v = seq[i], seq[i + 1]
-
-                if G.has_edge(u, v):
-                    # if the graph already has this edge, that means this segment
-                    # exists on a different line as well – capture that
-                    G[u][v]["lines"].add(ln)
-                else:
-                    # if not, then add this edge and line to the graph
-                    G.add_edge(u, v, lines={ln}, weight=1)
+        G.add_edges_from(
+            (u, v, {"lines": config.SEGMENT_TO_LINES[(u, v)], "weight": 1})
+            for _, u, v in line_segments
+        )
         return G
 
-    def _build_routing_graph(self) -> nx.DiGraph:
+    def _build_routing_graph(
+        self, line_segments
+    ) -> tuple[list[tuple[str, str]], csr_matrix]:
         """Builds a directed graph where nodes are (Station, Line).
         Edges allow travel (cost=1) or transfers (cost=PENALTY).
 
@@ -79,57 +137,123 @@ class BartNetwork:
         Intuitively, the routing graph flattens the structure of graph – the edge labels
         `lines` from the physical graph are flattened into separate nodes in the routing
         graph
+
+        Nodes get dense integer ids in the order they are first seen, and the edges are
+        returned as an (N x N) CSR matrix of weights so shortest paths run in SciPy.
         """
+        # 1. Travel edges (Station A, Red) -> (Station B, Red)
+        # Bidirectional travel allowed
+        travel_edges = [
+            edge
+            for ln, u, v in line_segments
+            for edge in (((u, ln), (v, ln), 1), ((v, ln), (u, ln), 1))
+        ]
+
+        # 2. Transfer edges at the same station
+        # Every ordered pair of distinct lines at a station is a transfer
+        transfer_edges = [
+            ((s, l1), (s, l2), config.TRANSFER_PENALTY_EDGES)
+            for s, lines_at_s in config.STATION_TO_LINES.items()
+            for l1, l2 in permutations(lines_at_s, 2)
+        ]
+
+        # 3. Number the nodes in the order they are first seen, and pack the edges
+        edges = travel_edges + transfer_edges
+        node_ids = {}
+        src, dst, weights = array("i"), array("i"), array("d")
+        for u, v, weight in edges:
+            src.append(node_ids.setdefault(u, len(node_ids)))
+            dst.append(node_ids.setdefault(v, len(node_ids)))
+            weights.append(weight)
+
+        n = len(node_ids)
+        csr = csr_matrix((weights, (src, dst)), shape=(n, n))
+        return list(node_ids), csr
+
+    @cached_property
+    def routing_graph(self) -> nx.DiGraph:
+        """NetworkX copy of `routing_csr`, used for visualization and graph checks."""
         G = nx.DiGraph()
+        G.add_nodes_from(self.routing_nodes)
+        coo = self.routing_csr.tocoo()
+        G.add_weighted_edges_from(
+            (self.routing_nodes[i], self.routing_nodes[j], float(w))
+            for i, j, w in zip(coo.row, coo.col, coo.data)
+        )
+        return G
 
-        # 1. Add travel edges (Station A, Red) -> (Station B, Red)
-        for ln, seq in self.lines.items():
-            for i in range(len(seq) - 1):
-                u, v = seq[i], seq[i + 1]
-                # Bidirectional travel allowed
-                G.add_edge((u, ln), (v, ln), weight=1)
-                G.add_edge((v, ln), (u, ln), weight=1)
-
-        # 2. Add transfer edges at the same station
-        # Find which lines serve which station
-        station_to_lines = defaultdict(set)
-        for ln, seq in self.lines.items():
-            for s in seq:
-                station_to_lines[s].add(ln)
-
-        for s, lines_at_s in station_to_lines.items():
-            lines_list = list(lines_at_s)
-            for l1 in lines_list:
-                for l2 in lines_list:
-                    if l1 != l2:
-                        # Transfer cost
-                        G.add_edge(
-                            (s, l1), (s, l2), weight=config.TRANSFER_PENALTY_EDGES
-                        )
+    def shortest_paths(self, sources=None) -> np.ndarray:
+        """Shortest path distances from each of the `sources` node ids to every node.
 
-        return G
+        Returns:
+            array of shape (len(sources), N), indexed by routing node id. With no
+            sources, this is the full (N x N) all-pairs table.
+        """
+        return dijkstra(self.routing_csr, directed=True, indices=sources)
+
+    @cached_property
+    def dist(self) -> np.ndarray:
+        """All-pairs shortest distances between routing nodes, as int16.
 
-    def _get_segments_by_line(self) -> dict[LineDirection, list[Segment]]:
+        Answering "how far is (A, RED) from (B, BLUE)?" is then a table lookup instead
+        of a graph search. Computed on first use, so the optimizer path (which routes
+        with its own lookup) does not pay for it.
+
+        Edge weights are whole numbers of stops/transfer penalties, so the distances
+        are small integers. Pairs with no path are set to UNREACHABLE.
+        """
+        dist = self.shortest_paths()
+        dist[np.isinf(dist)] = UNREACHABLE
+        return dist.astype(np.int16)
+
+    @cached_property
+    def pos(self) -> dict[str, np.ndarray]:
+        """(x, y) coordinates of every station, for plotting.
+
+        Kamada-Kawai is expensive and the layout only depends on config.LINES, so it is
+        computed once and pickled to DATA_DIR, keyed by a hash of the lines.
+        """
+        key = hashlib.sha1(repr(sorted(self.lines.items())).encode()).hexdigest()[:12]
+        cache_path = config.DATA_DIR / config.LAYOUT_CACHE_TEMPLATE.format(key=key)
+        if cache_path.exists():
+            try:
+                with open(cache_path, "rb") as f:
+                    return pickle.load(f)
+            except (pickle.UnpicklingError, EOFError, OSError, ValueError) as e:
+                # A damaged cache is just recomputed (and overwritten) below
+                logger.warning("Ignoring unreadable layout cache %s: %s", cache_path, e)
+
+        # Kamada-Kawai layout is better for transport maps (less overlapping)
+        pos = nx.kamada_kawai_layout(self.graph, scale=2)
+        # Written under a temporary name first, so an interrupted write is never loaded
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(pos, f)
+        tmp_path.replace(cache_path)
+        return pos
+
+    def distance(self, source: tuple[str, str], target: tuple[str, str]) -> int:
+        """Shortest routing distance between two (Station, Line) nodes."""
+        return int(self.dist[self.node_ids[source], self.node_ids[target]])
+
+    def _get_segments_by_line(
+        self, line_segments
+    ) -> dict[LineDirection, tuple[Segment, ...]]:
         """
         Returns a structured lookup of which segments belong to which line/direction.
         """
-        segments = {}
-        for ln, seq in self.lines.items():
-            if ln not in config.MODEL_LINES:
-                continue
+        fwd_by_line = {}
+        for ln, u, v in line_segments:
+            if ln in config.MODEL_LINES:
+                fwd_by_line.setdefault(ln, []).append(Segment(u, v))
 
-            # FWD direction
-            key_fwd = LineDirection(line=ln, direction="FWD")
-            segments[key_fwd] = [
-                Segment(seq[i], seq[i + 1]) for i in range(len(seq) - 1)
-            ]
+        segments = {}
+        for ln, fwd in fwd_by_line.items():
+            segments[LineDirection(line=ln, direction="FWD")] = tuple(fwd)
 
-            # REV direction
-            rev_seq = seq[::-1]
+            # REV direction is just the FWD segments flipped, walked back to front
             key_rev = LineDirection(line=ln, direction="REV")
-            segments[key_rev] = [
-                Segment(rev_seq[i], rev_seq[i + 1]) for i in range(len(rev_seq) - 1)
-            ]
+            segments[key_rev] = tuple(Segment(seg.v, seg.u) for seg in reversed(fwd))
 
         return segments
 
@@ -149,10 +273,11 @@ class BartNetwork:
         Interactive Plotly visualization of the network topology.
         Uses Kamada-Kawai layout for a cleaner, map-like arrangement.
         """
-        G = self.graph
+        # Plotly is slow to import and only needed here, not for the optimizer
+        import plotly.graph_objects as go
 
-        # Kamada-Kawai layout is better for transport maps (less overlapping)
-        pos = nx.kamada_kawai_layout(G, scale=2)
+        G = self.graph
+        pos = self.pos
 
         fig = go.Figure()
 
@@ -162,17 +287,11 @@ class BartNetwork:
         for line_name, stations in self.lines.items():
             color = config.LINE_COLORS.get(line_name, "#888")
 
-            edge_x = []
-            edge_y = []
-
             # Walk the sequence of stations for this line
-            for i in range(len(stations) - 1):
-                u, v = stations[i], stations[i + 1]
-                if u in pos and v in pos:
-                    x0, y0 = pos[u]
-                    x1, y1 = pos[v]
-                    edge_x.extend([x0, x1, None])
-                    edge_y.extend([y0, y1, None])
+            pairs = [
+                (u, v) for u, v in zip(stations, stations[1:]) if u in pos and v in pos
+            ]
+            edge_x, edge_y = _segment_coords(pos, pairs)
 
             fig.add_trace(
                 go.Scatter(
@@ -233,8 +352,10 @@ class BartNetwork:
 
         This reveals the "Transfer Elevators" connecting the layers.
         """
+        import plotly.graph_objects as go
+
         # 1. Get the 2D layout for X, Y coords
-        pos_2d = nx.kamada_kawai_layout(self.graph, scale=2)
+        pos_2d = self.pos
 
         # 2. Assign a "Z-height" to each line
         # We only plot the lines we model + OAK
@@ -250,21 +371,14 @@ class BartNetwork:
             z_height = line_to_z[ln]
             color = config.LINE_COLORS.get(ln, "#888")
 
-            edge_x, edge_y, edge_z = [], [], []
-
-            # Iterate the Routing Graph directly to be true to the data
-            # Filter edges where both nodes are on line 'ln'
-            for u_node, v_node in self.routing_graph.edges():
-                u_st, u_ln = u_node
-                v_st, v_ln = v_node
-
-                # Check if this is a "Travel Edge" on the current line
-                if u_ln == ln and v_ln == ln:
-                    x0, y0 = pos_2d[u_st]
-                    x1, y1 = pos_2d[v_st]
-                    edge_x.extend([x0, x1, None])
-                    edge_y.extend([y0, y1, None])
-                    edge_z.extend([z_height, z_height, None])
+            # The travel edges on line 'ln' are exactly its consecutive stations, so
+            # walk the line directly instead of filtering every routing graph edge.
+            # (The routing graph has both directions, but they draw the same segment)
+            seq = self.lines[ln]
+            pairs = list(zip(seq, seq[1:]))
+            edge_x, edge_y = _segment_coords(pos_2d, pairs)
+            heights = np.full(len(pairs), z_height)
+            edge_z = _interleave(heights, heights)
 
             fig.add_trace(
                 go.Scatter3d(
@@ -279,21 +393,18 @@ class BartNetwork:
             )
 
         # Part B: Draw the "Elevators" (Transfer Edges)
-        trans_x, trans_y, trans_z = [], [], []
-
-        for u_node, v_node in self.routing_graph.edges():
-            u_st, u_ln = u_node
-            v_st, v_ln = v_node
-
-            # It is a transfer if stations are same, but lines are different
-            if u_st == v_st and u_ln != v_ln:
-                x, y = pos_2d[u_st]
-                z1 = line_to_z[u_ln]
-                z2 = line_to_z[v_ln]
-
-                trans_x.extend([x, x, None])
-                trans_y.extend([y, y, None])
-                trans_z.extend([z1, z2, None])
+        # It is a transfer if stations are same, but lines are different. One pass over
+        # the edges picks them all out, independent of the number of lines
+        transfers = [
+            (u_st, u_ln, v_ln)
+            for (u_st, u_ln), (v_st, v_ln) in self.routing_graph.edges()
+            if u_st == v_st and u_ln != v_ln
+        ]
+        trans_x, trans_y = _segment_coords(pos_2d, [(st, st) for st, _, _ in transfers])
+        trans_z = _interleave(
+            np.array([line_to_z[l1] for _, l1, _ in transfers]),
+            np.array([line_to_z[l2] for _, _, l2 in transfers]),
+        )
 
         fig.add_trace(
             go.Scatter3d(
@@ -348,6 +459,16 @@ class BartNetwork:
         fig.show()
 
 
+@cache
+def get_bart_network() -> BartNetwork:
+    """The shared BartNetwork instance.
+
+    The network is a pure function of config, so it only needs to be built once per
+    process. Use this instead of constructing BartNetwork() directly.
+    """
+    return BartNetwork()
+
+
 if __name__ == "__main__":
-    bart = BartNetwork()
+    bart = get_bart_network()
     bart.visualize_routing()
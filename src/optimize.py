@@ -2,9 +2,9 @@ import gurobipy as gp
 from gurobipy import GRB
 
 import src.config as config
-from routing import calculate_segment_demand, fetch_or_load_data
+from src.routing import calculate_segment_demand, fetch_or_load_data
 from src.logging_config import setup_logger
-from src.network import BartNetwork
+from src.network import get_bart_network
 from src.report import print_schedule_table
 
 logger = setup_logger(__name__)
@@ -12,32 +12,34 @@ logger = setup_logger(__name__)
 
 def get_lines_on_segment(u, v):
     """
-    Helper: Returns a list of line names ('RED', 'YELLOW') that physically
+    Helper: Returns the line names ('RED', 'YELLOW') that physically
     travel between station u and station v.
     """
-    logger.debug(f"Finding lines serving segment {u} -> {v}")
-    serving_lines = []
-    for line_name, stations in config.LINES.items():
-        # Check if u and v appear sequentially in this line's station list
-        # (We check both directions because the segment demand is directed)
-        if u in stations and v in stations:
-            idx_u = stations.index(u)
-            idx_v = stations.index(v)
-            if abs(idx_u - idx_v) == 1:
-                serving_lines.append(line_name)
-    logger.debug(f"Segment {u} -> {v} served by: {serving_lines}")
+    # Precomputed in config from each line's consecutive stations, in both directions
+    # (because the segment demand is directed)
+    serving_lines = config.SEGMENT_TO_LINES.get((u, v), frozenset())
+    logger.debug("Segment %s -> %s served by: %s", u, v, serving_lines)
     return serving_lines
 
 
-def run_optimization(segment_demand: dict):
+def run_optimization(segment_demand: dict, debug: bool = False):
+    """
+    Solves for the cheapest schedule that leaves the fewest passengers behind.
+
+    With debug=True, also reports the binding constraints of the solution, and on
+    failure computes an IIS and writes it to infeasible.ilp. Both can take as long
+    as the solve itself, so they are off by default.
+    """
     logger.info("Starting optimization...")
-    logger.debug(f"Received demand data for {len(segment_demand)} segment-period pairs")
+    logger.debug(
+        "Received demand data for %s segment-period pairs", len(segment_demand)
+    )
 
     # 1. Setup Data
     logger.debug("Setting up model data...")
     cycle_times = config.ROUND_TRIP_HOURS
     model = gp.Model("BART_Schedule_Opt")
-    logger.debug(f"Round trip times: {cycle_times}")
+    logger.debug("Round trip times: %s", cycle_times)
 
     # Mute Gurobi output for cleaner logs
     model.setParam("OutputFlag", 0)
@@ -46,27 +48,29 @@ def run_optimization(segment_demand: dict):
     # 2. Decision Variables
     logger.debug("Creating decision variables...")
     # f[line, period, cars] = Frequency (trains per hour)
-    f = {}
-    var_count = 0
-    for line in config.LINES:
-        for period in config.PERIOD_TO_HOURS:
-            for size in config.POSSIBLE_TRAIN_LENGTHS:
-                # Variable: Integer number of trains per hour
-                f[line, period, size] = model.addVar(
-                    vtype=GRB.INTEGER, name=f"freq_{line}_{period}_{size}cars"
-                )
-                var_count += 1
-    logger.debug(f"Created {var_count} frequency variables")
-
-    # Unmet Demand Vars (One per segment/period)
+    # Variable: Integer number of trains per hour
+    # No single train size can exceed the line's total cap, so bound each variable
+    # by it too; this gives presolve tight bounds without adding any rows
+    f = model.addVars(
+        config.LINES,
+        config.PERIOD_TO_HOURS,
+        config.POSSIBLE_TRAIN_LENGTHS,
+        ub=config.MAX_FREQ,
+        vtype=GRB.INTEGER,
+        name="freq",
+    )
+    logger.debug("Created %s frequency variables", len(f))
+
+    # Unmet Demand Vars (One per segment/period with demand)
     # u[seg, period] = Unmet Demand (pax per hour)
+    # A segment/period with no demand is always satisfied, so it needs neither an
+    # unmet var nor a demand constraint
     logger.debug("Creating unmet demand variables...")
-    u = {}
-    for seg, period in segment_demand.keys():
-        u[seg, period] = model.addVar(
-            vtype=GRB.CONTINUOUS, lb=0.0, name=f"unmet_{seg.u}_{seg.v}_{period}"
-        )
-    logger.debug(f"Created {len(u)} unmet demand variables")
+    positive_demand = {key: pax for key, pax in segment_demand.items() if pax > 0}
+    u = model.addVars(
+        positive_demand.keys(), vtype=GRB.CONTINUOUS, lb=0.0, name="unmet"
+    )
+    logger.debug("Created %s unmet demand variables", len(u))
 
     # 3. Constraints
     logger.debug("Adding constraints...")
@@ -75,55 +79,75 @@ def run_optimization(segment_demand: dict):
     logger.debug("Adding demand constraints...")
     # We must be able to meet demand as best as possible
     # Capacity + Unmet >= Demand
-    demand_constraint_count = 0
-    for (seg, period), demand_pax in segment_demand.items():
-        # What specific lines are serving this segment?
-        lines_here = get_lines_on_segment(seg.u, seg.v)
-
-        if not lines_here:
-            logger.error(f"{seg.u} -> {seg.v} not served on any line")
-            raise ValueError(f"{seg.u} -> {seg.v} not served on any line")
-
-        # calculate capacity
-        # Capacity = Frequency * Car_Count * Pax_Per_Car
-        total_capacity = gp.quicksum(
-            f[line, period, size] * size * config.CAP_PER_CAR
-            for line in lines_here
-            for size in config.POSSIBLE_TRAIN_LENGTHS
-        )
-
-        model.addConstr(
-            total_capacity + u[seg, period] >= demand_pax,
+    # What specific lines are serving each segment?
+    lines_on = {}
+    for seg, _ in segment_demand:
+        if seg not in lines_on:
+            lines_on[seg] = get_lines_on_segment(seg.u, seg.v)
+            if not lines_on[seg]:
+                logger.error("%s -> %s not served on any line", seg.u, seg.v)
+                raise ValueError(f"{seg.u} -> {seg.v} not served on any line")
+
+    # calculate capacity
+    # Capacity = Frequency * Car_Count * Pax_Per_Car
+    # Each capacity is built from parallel coefficient/variable lists in one LinExpr
+    # call. Segments served by the same set of lines share it within a period
+    cap_coefs = [size * config.CAP_PER_CAR for size in config.POSSIBLE_TRAIN_LENGTHS]
+    capacity = {}
+    demand_constrs = {}
+    for (seg, period), demand_pax in positive_demand.items():
+        lines_here = lines_on[seg]
+        if (lines_here, period) not in capacity:
+            capacity[lines_here, period] = gp.LinExpr(
+                cap_coefs * len(lines_here),
+                [
+                    f[line, period, size]
+                    for line in lines_here
+                    for size in config.POSSIBLE_TRAIN_LENGTHS
+                ],
+            )
+        demand_constrs[seg, period] = model.addLConstr(
+            capacity[lines_here, period] + u[seg, period],
+            GRB.GREATER_EQUAL,
+            demand_pax,
             name=f"Dem_{seg.u}_{seg.v}_{period}",
         )
-        demand_constraint_count += 1
-    logger.debug(f"Added {demand_constraint_count} demand constraints")
+    logger.debug(
+        "Added %s demand constraints over %s distinct capacities",
+        len(demand_constrs),
+        len(capacity),
+    )
 
     # B. Frequency Policy
     logger.debug("Adding frequency policy constraints...")
     # We have to abide by certain minimum service policies, and cannot run more
     # trains / hour than a pre-specified maximum
     # Min <= Total Trains Per Hour <= Max
-    freq_constraint_count = 0
-    for line in config.LINES:
-        for period in config.PERIOD_TO_HOURS:
-            total_freq = gp.quicksum(
-                f[line, period, size] for size in config.POSSIBLE_TRAIN_LENGTHS
-            )
-
-            # Max Frequency
-            model.addConstr(
-                total_freq <= config.MAX_FREQ, name=f"MaxFreq_{line}_{period}"
-            )
-            freq_constraint_count += 1
-
-            # Min Frequency
-            model.addConstr(
-                total_freq >= config.MIN_FREQ, name=f"MinFreq_{line}_{period}"
-            )
-            freq_constraint_count += 1
+    # The cap applies to the sum over train sizes, so it stays a row per line/period
+    max_freq_constrs = model.addConstrs(
+        (
+            f.sum(line, period, "*") <= config.MAX_FREQ
+            for line in config.LINES
+            for period in config.PERIOD_TO_HOURS
+        ),
+        name="MaxFreq",
+    )
+    # Frequencies are non-negative already, so a minimum of 0 needs no rows at all
+    min_freq_constrs = {}
+    if config.MIN_FREQ > 0:
+        min_freq_constrs = model.addConstrs(
+            (
+                f.sum(line, period, "*") >= config.MIN_FREQ
+                for line in config.LINES
+                for period in config.PERIOD_TO_HOURS
+            ),
+            name="MinFreq",
+        )
     logger.debug(
-        f"Added {freq_constraint_count} frequency constraints (min: {config.MIN_FREQ}, max: {config.MAX_FREQ})"
+        "Added %s frequency constraints (min: %s, max: %s)",
+        len(max_freq_constrs) + len(min_freq_constrs),
+        config.MIN_FREQ,
+        config.MAX_FREQ,
     )
 
     # C. Fleet Size
@@ -131,22 +155,22 @@ def run_optimization(segment_demand: dict):
     # We must not use more cars than exist in the global fleet.
     # Cars Needed = Frequency * CycleTime * TrainSize
     total_fleet_available = config.FLEET_MAX
-    logger.debug(f"Total fleet available: {total_fleet_available} cars")
+    logger.debug("Total fleet available: %s cars", total_fleet_available)
 
     # for a period, for a line, for a train size: f * size * round trip = cars
-    fleet_constraint_count = 0
-    for period in config.PERIOD_TO_HOURS:
-        total_cars_needed = gp.quicksum(
-            f[line, period, size] * size * cycle_times[line]
-            for line in config.LINES
-            for size in config.POSSIBLE_TRAIN_LENGTHS
-        )
-
-        model.addConstr(
-            total_cars_needed <= total_fleet_available, name=f"FleetCap_{period}"
-        )
-        fleet_constraint_count += 1
-    logger.debug(f"Added {fleet_constraint_count} fleet capacity constraints")
+    # The per-variable coefficients are computed once and reused by the cost below
+    fleet_coef = {
+        (line, period, size): size * cycle_times[line]
+        for line, period, size in f.keys()
+    }
+    fleet_constrs = model.addConstrs(
+        (
+            f.prod(fleet_coef, "*", period, "*") <= total_fleet_available
+            for period in config.PERIOD_TO_HOURS
+        ),
+        name="FleetCap",
+    )
+    logger.debug("Added %s fleet capacity constraints", len(fleet_constrs))
 
     # 4. Objective
     logger.debug("Setting up objective functions...")
@@ -155,54 +179,50 @@ def run_optimization(segment_demand: dict):
 
     # Cost = Car-hours
     logger.debug("Computing operational cost expression...")
-    ops_cost = gp.quicksum(
-        f[line, period, size]
-        * size
-        * cycle_times[line]
-        * len(config.PERIOD_TO_HOURS[period])
-        for line in config.LINES
-        for period in config.PERIOD_TO_HOURS
-        for size in config.POSSIBLE_TRAIN_LENGTHS
-    )
+    cost_coef = {
+        (line, period, size): coef * config.PERIOD_HOURS[period]
+        for (line, period, size), coef in fleet_coef.items()
+    }
+    ops_cost = f.prod(cost_coef)
     logger.debug("Computing unmet demand penalty expression...")
-    unmet_penalty = gp.quicksum(u[seg, period] for seg, period in segment_demand.keys())
+    unmet_penalty = u.sum()
 
     # One approach is Big M:
     # model.setObjective((1000000 * unmet_penalty) + ops_cost, GRB.MINIMIZE)
 
-    # Other approach is lexicographic
-    # Phase 1: Minimize Unmet Demand
-    logger.info("Phase 1: Minimizing unmet demand...")
-    model.setObjective(unmet_penalty, GRB.MINIMIZE)
-    model.optimize()
-
-    if model.status != GRB.OPTIMAL:
-        logger.error("Phase 1 optimization failed: model is infeasible")
-        return None
-
-    min_possible_unmet = model.objVal
-    logger.info(
-        f"Phase 1 complete. Minimum Unmet Demand: {min_possible_unmet:,.0f} passengers/hr"
+    # Other approach is lexicographic, which Gurobi solves natively
+    # Priority 2 (unmet demand) is minimized first, then priority 1 (cost) subject
+    # to unmet demand staying within max(abstol, reltol * optimum) of its optimum.
+    # A tolerance relative to the demand scale keeps the lock numerically stable
+    # when unmet demand is large
+    model.ModelSense = GRB.MINIMIZE
+    model.setObjectiveN(
+        unmet_penalty,
+        index=0,
+        priority=2,
+        abstol=config.UNMET_ABS_TOL,
+        reltol=config.UNMET_REL_TOL,
+        name="Unmet",
     )
-
-    # Now, we add this as a constraint
-    logger.debug("Locking Phase 1 solution as constraint...")
-    model.addConstr(unmet_penalty <= min_possible_unmet + 0.01, name="Stage1_Lock")
-
-    # Phase 2: Minimize the Operational Cost
-    logger.info("Phase 2: Minimizing operational cost (with unmet demand locked)...")
-    model.setObjective(ops_cost, GRB.MINIMIZE)
+    model.setObjectiveN(ops_cost, index=1, priority=1, name="OpsCost")
+    # For MIPs the unmet pass's MIPGap also widens the allowed degradation (by up to
+    # 1e-4 * unmet), so solve that pass to optimality to leave the tolerance above
+    # as the only slack
+    model.getMultiobjEnv(0).setParam("MIPGap", 0)
 
     # 5. Solve
-    logger.debug("Starting Phase 2 optimization...")
+    logger.info("Solving: minimizing unmet demand, then operational cost...")
     model.optimize()
 
     if model.status == GRB.OPTIMAL:
         total_unmet = unmet_penalty.getValue()
         logger.info("Optimization successful!")
-        logger.info(f"   - Operational Cost: {ops_cost.getValue():,.0f} car-hours")
         logger.info(
-            f"   - Stranded Passengers: {total_unmet:,.0f} (Should be 0 if demand is satisfiable)"
+            "   - Operational Cost: %s car-hours", format(ops_cost.getValue(), ",.0f")
+        )
+        logger.info(
+            "   - Stranded Passengers: %s (Should be 0 if demand is satisfiable)",
+            format(total_unmet, ",.0f"),
         )
 
         logger.debug("Extracting schedule from solution...")
@@ -213,29 +233,34 @@ def run_optimization(segment_demand: dict):
                     val = f[line, period, size].X
                     if val > 0:
                         schedule[(line, period, size)] = int(val)
-        logger.debug(f"Schedule contains {len(schedule)} non-zero entries")
+        logger.debug("Schedule contains %s non-zero entries", len(schedule))
 
         # Extract binding constraints
-        logger.debug("Identifying binding constraints...")
-        binding_constraints = []
-        for constr in model.getConstrs():
-            if abs(constr.slack) < 1e-6:  # Numerically close to 0
-                binding_constraints.append(constr.constrName)
-
-        if binding_constraints:
-            logger.info(f"Binding Constraints ({len(binding_constraints)}):")
-            for constr_name in sorted(binding_constraints):
-                print(f"  - {constr_name}")
-        else:
-            logger.info("No binding constraints found.")
+        if debug:
+            logger.debug("Identifying binding constraints...")
+            constrs = model.getConstrs()
+            slacks = model.getAttr("Slack", constrs)
+            names = model.getAttr("ConstrName", constrs)
+            # Numerically close to 0
+            binding_constraints = [
+                name for name, slack in zip(names, slacks) if abs(slack) < 1e-6
+            ]
+
+            if binding_constraints:
+                logger.info("Binding Constraints (%s):", len(binding_constraints))
+                for constr_name in sorted(binding_constraints):
+                    print(f"  - {constr_name}")
+            else:
+                logger.info("No binding constraints found.")
 
         return schedule
     else:
-        logger.error("Phase 2 optimization failed: model is infeasible")
-        logger.debug("Computing Irreducible Inconsistent Subsystem (IIS)...")
-        model.computeIIS()
-        model.write("infeasible.ilp")
-        logger.error("Infeasibility report written to infeasible.ilp")
+        logger.error("Optimization failed: model is infeasible")
+        if debug:
+            logger.debug("Computing Irreducible Inconsistent Subsystem (IIS)...")
+            model.computeIIS()
+            model.write("infeasible.ilp")
+            logger.error("Infeasibility report written to infeasible.ilp")
         return None
 
 
@@ -246,18 +271,18 @@ if __name__ == "__main__":
     set_global_log_level("INFO")
 
     logger.info("Starting BART Schedule Optimization")
-    network = BartNetwork()
+    network = get_bart_network()
     logger.info("Network initialized")
 
     df = fetch_or_load_data()
-    logger.info(f"Data loaded: {len(df)} records")
+    logger.info("Data loaded: %s records", len(df))
 
     segment_demand = calculate_segment_demand(network, df)
     logger.info(
-        f"Segment demand calculated: {len(segment_demand)} segment-period pairs"
+        "Segment demand calculated: %s segment-period pairs", len(segment_demand)
     )
 
-    solution = run_optimization(segment_demand)
+    solution = run_optimization(segment_demand, debug=True)
 
     if solution:
         logger.info("Generating schedule report...")
@@ -84,5 +84,5 @@ def print_schedule_table(schedule):
     print("\n")
 
     if min_freq_lines:
-        logger.debug(f"Lines at minimum frequency: {', '.join(min_freq_lines)}")
+        logger.debug("Lines at minimum frequency: %s", ", ".join(min_freq_lines))
     logger.info("Schedule report complete")
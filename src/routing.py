@@ -1,18 +1,70 @@
 import gzip
-import shutil
+import hashlib
+import io
+import multiprocessing as mp
+import os
+import pickle
+import weakref
 from collections import defaultdict
+from collections.abc import ItemsView, Iterable, Mapping, ValuesView
+from itertools import permutations
+from pathlib import Path
 
 import networkx as nx
+import numpy as np
 import pandas as pd
 import requests
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
 
 import src.config as config
 from src.network import BartNetwork, Segment
 from src.logging_config import setup_logger
 
+try:
+    # Optional: decompresses gzip on multiple threads
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
 logger = setup_logger(__name__)
 
 
+class _TeeReader(io.RawIOBase):
+    """Read-only stream that copies every byte read from source into sink."""
+
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.source.readinto(buffer)
+        self.sink.write(memoryview(buffer)[:n])
+        return n
+
+
+def _read_od_csv(source) -> pd.DataFrame:
+    """Parses the OD CSV at source, a path or an uncompressed binary stream."""
+    # BART data headers are usually: Date, Hour, Origin, Destination, Trip Count
+    # Set the expected columns in config for sanity
+    # The pyarrow engine parses (and decompresses) on multiple threads
+    df = pd.read_csv(
+        source,
+        names=config.OD_FILE_COLUMNS,
+        dtype=config.OD_FILE_DTYPES,
+        engine="pyarrow",
+    )
+    # Give origin and dest the same categories so they can be compared directly
+    stations = df["origin"].cat.categories.union(df["dest"].cat.categories)
+    df[["origin", "dest"]] = df[["origin", "dest"]].astype(
+        pd.CategoricalDtype(stations)
+    )
+    return df
+
+
 def fetch_or_load_data() -> pd.DataFrame:
     """
     Checks if the data file exists locally. If not, downloads it from BART.
@@ -20,61 +72,285 @@ def fetch_or_load_data() -> pd.DataFrame:
     """
     # 1. Check if file exists
     file_path = config.OD_FILEPATH
-    logger.debug(f"Checking for data file at {file_path}")
+    # Parsed data is also kept as Parquet next to it, which loads much faster than
+    # the CSV and keeps the dtypes. It's only used while it's newer than the CSV
+    parquet_path = file_path.with_suffix("").with_suffix(".parquet")
+    if parquet_path.exists() and (
+        not file_path.exists()
+        or parquet_path.stat().st_mtime >= file_path.stat().st_mtime
+    ):
+        logger.info("Loading data from %s...", parquet_path)
+        df = pd.read_parquet(parquet_path)
+        # Parquet has no second resolution, so dates come back in milliseconds
+        df["date"] = df["date"].astype(config.OD_FILE_DTYPES["date"])
+        logger.info("Data loaded: %s records", len(df))
+        return df
+
+    logger.debug("Checking for data file at %s", file_path)
 
     if not file_path.exists():
-        logger.warning(f"Data file not found at {file_path}")
+        logger.warning("Data file not found at %s", file_path)
         logger.info("Attempting to download from BART (this may take a moment)...")
 
         # Construct URL
-        filename = config.OD_FILE_TEMPLATE.format(year=config.TARGET_YEAR)
         url = config.OD_URL_TEMPLATE.format(year=config.TARGET_YEAR)
-        logger.debug(f"Download URL: {url}")
+        logger.debug("Download URL: %s", url)
 
         try:
             # Stream download to avoid memory spikes (thanks Gemini)
+            # The stream is parsed as it arrives, and a copy is written to file_path
+            # on the way so later runs can load it from disk
             logger.debug("Starting download...")
-            with requests.get(url, stream=True) as r:
+            with requests.get(url, stream=True) as r, open(file_path, "wb") as f:
                 r.raise_for_status()
-                # Save as compressed file first if needed, or read directly
-                # BART usually serves .csv.gz
-                temp_gz = config.DATA_DIR / filename
-                with open(temp_gz, "wb") as f:
-                    shutil.copyfileobj(r.raw, f)
-                logger.debug(f"Downloaded to {temp_gz}")
-
-            # If the config path expects a CSV but we downloaded a GZ, decompress
-            if file_path.suffix == ".csv" and temp_gz.suffix == ".gz":
-                logger.info("Decompressing data...")
-                with gzip.open(temp_gz, "rb") as f_in:
-                    with open(file_path, "wb") as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                temp_gz.unlink()  # Remove the .gz after extraction
-                logger.debug("Decompression complete")
+                # BART usually serves .csv.gz. If the config path expects a CSV,
+                # cache the decompressed bytes, otherwise the compressed ones
+                logger.info("Decompressing and parsing data while downloading...")
+                if file_path.suffix == ".csv":
+                    stream = _TeeReader(gzip.GzipFile(fileobj=r.raw), f)
+                else:
+                    stream = gzip.GzipFile(fileobj=_TeeReader(r.raw, f))
+                with stream:
+                    df = _read_od_csv(io.BufferedReader(stream))
+                logger.debug("Downloaded to %s", file_path)
 
             logger.info("Download and extraction complete.")
 
         except Exception as e:
-            logger.error(f"Failed to download data: {e}", exc_info=True)
+            # Don't leave a partial file behind to be loaded as the cache next time
+            file_path.unlink(missing_ok=True)
+            logger.error("Failed to download data: %s", e, exc_info=True)
             raise RuntimeError(f"Failed to download data: {e}")
     else:
-        logger.debug(f"Data file found at {file_path}")
+        logger.debug("Data file found at %s", file_path)
+
+        # 2. Load Data
+        logger.info("Loading data from %s...", file_path)
+        # Inflating the archive is single threaded otherwise, and dominates the load
+        if file_path.suffix == ".gz" and rapidgzip is not None:
+            with rapidgzip.open(
+                str(file_path), parallelization=os.cpu_count()
+            ) as stream:
+                df = _read_od_csv(stream)
+        else:
+            df = _read_od_csv(file_path)
 
-    # 2. Load Data
-    logger.info(f"Loading data from {file_path}...")
-    # BART data headers are usually: Date, Hour, Origin, Destination, Trip Count
-    # Set the expected columns in config for sanity
-    df = pd.read_csv(file_path, names=config.OD_FILE_COLUMNS)
-    logger.info(f"Data loaded: {len(df)} records")
+    # Write under a temporary name first, so an interrupted write is never loaded
+    logger.debug("Caching parsed data at %s", parquet_path)
+    tmp_path = parquet_path.with_suffix(".tmp")
+    df.to_parquet(tmp_path, compression="zstd")
+    tmp_path.replace(parquet_path)
+
+    logger.info("Data loaded: %s records", len(df))
     return df
 
 
-def build_path_lookup(network: BartNetwork) -> dict[tuple[str, str], list[Segment]]:
+# Lookups built this session, by the object holding the routing graph (see
+# _routing_edges) and then by the same key as the disk cache. Held weakly, so they go
+# away with their graph. They're shared between callers, so don't mutate them
+_LOOKUP_MEMO: weakref.WeakKeyDictionary[object, dict[str, "PathLookup"]] = (
+    weakref.WeakKeyDictionary()
+)
+
+# Below this many origins, routing in a process pool costs more than it saves
+_MIN_PARALLEL_ORIGINS = 16
+
+# The routing graph and its nodes' stations, handed to each pool worker once when it
+# starts
+_worker_graph = None
+
+
+def _init_route_worker(graph: csr_array, node_stations: list[str]) -> None:
+    global _worker_graph
+    _worker_graph = (graph, node_stations)
+
+
+def _route_origin_task(task) -> dict[tuple[str, str], list[Segment]]:
+    return _route_from_origin(*_worker_graph, *task)
+
+
+def _route_from_origin(
+    graph: csr_array,
+    node_stations: list[str],
+    origin: str,
+    source: int,
+    sink_by_dest: dict[str, int],
+) -> dict[tuple[str, str], list[Segment]]:
+    """
+    Shortest paths from one origin station to each of its destinations, as Segments.
+
+    The routing graph is given as a weighted CSR matrix over numbered nodes, with
+    node_stations[i] the station of node i. source is the origin's virtual source
+    node, and sink_by_dest maps each destination to its virtual sink node.
+
+    Destinations that can't be reached are left out.
+    """
+    # One Dijkstra (in compiled code) from the origin's virtual source, which is
+    # joined to every line the passenger could board at zero cost
+    dist, pred = dijkstra(graph, indices=source, return_predecessors=True)
+
+    # The physical Segment travelled into each node on the shortest path tree, or
+    # None for a transfer (same station) or the source. Comparing the stations for
+    # every node at once means each Segment is made once per tree, rather than once
+    # per path through it
+    stations = np.array(node_stations)
+    reached = pred >= 0
+    moved = reached & (stations[np.where(reached, pred, 0)] != stations)
+    seg_into = [
+        Segment(node_stations[p], node_stations[n]) if m else None
+        for n, (p, m) in enumerate(zip(pred.tolist(), moved.tolist()))
+    ]
+    # Walking paths touches one element at a time, which is faster on plain lists
+    pred = pred.tolist()
+
+    routed = {}
+    for dest, sink in sink_by_dest.items():
+        # Step 2/3: every ending (dest, line) node joins the destination's virtual
+        # sink at zero cost, so the sink's distance is already the shortest path
+        # across all possible lines
+        # Unreachable nodes are at infinity
+        if np.isinf(dist[sink]):
+            continue
+
+        # Step 4: Convert shortest path which is currently Node tuples into Segments
+        # Walk the predecessors back from the sink to the source, keeping the travel
+        # edges (transfers within a station don't use track capacity)
+        node = sink
+        segments = []
+        while node >= 0:
+            if seg_into[node] is not None:
+                segments.append(seg_into[node])
+            node = pred[node]
+        segments.reverse()
+
+        # Step 5: Append to our dictionary
+        routed[(origin, dest)] = segments
+
+    return routed
+
+
+class _PathValuesView(ValuesView):
+    def __iter__(self):
+        return iter(self._mapping._values)
+
+
+class _PathItemsView(ItemsView):
+    def __iter__(self):
+        return zip(self._mapping._keys, self._mapping._values)
+
+
+class PathLookup(Mapping):
+    """
+    Read-only mapping of (origin, dest) -> list[Segment], stored as a 2-D object
+    array over station indices.
+
+    It reads like the dict it replaces, but code that already works with station
+    indices (see station_index) can index paths[i, j] directly and skip hashing
+    (origin, dest) tuples. Cells for pairs without a path are None. Iteration is
+    row-major, i.e. by origin then destination in station order.
+
+    paths is read once, when the lookup is made, so fill it in before then.
+    """
+
+    def __init__(self, stations: Iterable[str], paths: np.ndarray | None = None):
+        self.stations = list(stations)
+        self.station_index = {s: i for i, s in enumerate(self.stations)}
+        n = len(self.stations)
+        self.paths = np.full((n, n), None, dtype=object) if paths is None else paths
+
+        # The cells holding a path, found once since the lookup never changes
+        cells = np.flatnonzero(np.not_equal(self.paths, None)).tolist()
+        self._keys = [(self.stations[c // n], self.stations[c % n]) for c in cells]
+        self._values = self.paths.ravel()[cells].tolist()
+
+    def __getitem__(self, pair: tuple[str, str]) -> list[Segment]:
+        origin, dest = pair
+        i = self.station_index.get(origin)
+        j = self.station_index.get(dest)
+        if i is None or j is None or self.paths[i, j] is None:
+            raise KeyError(pair)
+        return self.paths[i, j]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # Same views as Mapping's, but iterated off the precomputed lists instead of a
+    # lookup per key
+    def values(self) -> ValuesView:
+        return _PathValuesView(self)
+
+    def items(self) -> ItemsView:
+        return _PathItemsView(self)
+
+
+def _save_path_lookup(lookup: PathLookup, cache_path: Path):
+    # Only plain data is pickled, so the file loads however routing was imported.
+    # Written under a temporary name first, so an interrupted write is never loaded
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump((lookup.stations, lookup.paths), f)
+    tmp_path.replace(cache_path)
+    logger.debug("Path lookup cached to %s", cache_path)
+
+
+def _routing_edges(network) -> tuple[object, list, list[int], list[int], list[float]]:
+    """
+    The network's routing graph as (owner, nodes, rows, cols, weights): its
+    (Station, Line) nodes, and each weighted edge as a pair of node numbers.
+
+    BartNetwork already keeps the graph as a CSR matrix (routing_csr over
+    routing_nodes), which is read as is. Networks without one, like the test mocks,
+    give a NetworkX routing_graph instead, numbered in graph order. owner is the
+    object the graph belongs to, to memoize lookups against.
+    """
+    routing_csr = getattr(network, "routing_csr", None)
+    if routing_csr is not None:
+        coo = routing_csr.tocoo()
+        return (
+            network,
+            list(network.routing_nodes),
+            coo.row.tolist(),
+            coo.col.tolist(),
+            coo.data.tolist(),
+        )
+
+    G_route = network.routing_graph
+    nodes = list(G_route.nodes)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    rows, cols, weights = [], [], []
+    for u, v, weight in G_route.edges(data="weight"):
+        rows.append(node_index[u])
+        cols.append(node_index[v])
+        weights.append(weight)
+    return G_route, nodes, rows, cols, weights
+
+
+def build_path_lookup(
+    network: BartNetwork,
+    cache_dir: Path | None = None,
+    pairs: Iterable[tuple[str, str]] | None = None,
+    workers: int | None = None,
+) -> PathLookup:
     """
     Pre-calculates the shortest path for every possible OD pair in the system.
 
+    If pairs is given, only those (origin, dest) pairs are routed, e.g. the ones that
+    actually appear in the ridership data.
+
+    If workers > 1, origins are routed in a pool of that many processes (when there
+    are enough of them to be worth it); workers=-1 uses every core. The result is the
+    same either way.
+
+    If cache_dir is given, the lookup is pickled there keyed by a hash of the routing
+    graph's weighted edges, the stations and the pairs, and later calls for the same
+    ones just load it. Within a
+    session, a repeated call on the same graph object returns the same lookup.
+
     Returns:
-        dict[(origin, dest)] -> list[Segment]
+        PathLookup of (origin, dest) -> list[Segment]
     """
     # NOTE: The output here is the list of segments for the SINGLE shortest path
     # for every Origin-Destination pair.
@@ -97,82 +373,157 @@ def build_path_lookup(network: BartNetwork) -> dict[tuple[str, str], list[Segmen
     #       where Demand will be calculated from all paths like Ashby -> 19th St that
     #       use this segment
 
-    logger.info("Calculating shortest paths for all OD pairs...")
+    # Every (Station, Line) node numbered, and the weighted edges between them
+    owner, all_nodes, rows, cols, weights = _routing_edges(network)
+
+    # Step 1: pick the origin and destination pairs
+    # skip if its the same station, and route each pair only once
+    if pairs is None:
+        # permutations already leaves out same-station pairs
+        pairs = list(permutations(network.stations, 2))
+    else:
+        pairs = list(dict.fromkeys((o, d) for o, d in pairs if o != d))
+
+    # The paths depend only on the routing graph (its edges and weights), and on
+    # which pairs were routed. The network's stations (in order) set the lookup's
+    # station axis, and with no pairs given, the pairs themselves
+    edges = sorted(
+        zip([all_nodes[i] for i in rows], [all_nodes[j] for j in cols], weights)
+    )
+    # (the leading 2 is the file format, (stations, paths); bump it on changes)
+    key = hashlib.sha1(
+        repr((2, edges, list(network.stations), sorted(pairs))).encode()
+    ).hexdigest()[:12]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / config.PATH_CACHE_TEMPLATE.format(key=key)
+
+    # Already built this session for this graph? The key covers its edges, so a
+    # graph changed since then misses
+    memo = _LOOKUP_MEMO.setdefault(owner, {})
+    if key in memo:
+        logger.debug("Reusing the path lookup built earlier for this graph")
+        if cache_path is not None and not cache_path.exists():
+            _save_path_lookup(memo[key], cache_path)
+        return memo[key]
+
+    if cache_path is not None and cache_path.exists():
+        logger.info("Loading cached path lookup from %s", cache_path)
+        try:
+            with open(cache_path, "rb") as f:
+                memo[key] = PathLookup(*pickle.load(f))
+            return memo[key]
+        except (pickle.UnpicklingError, EOFError, OSError, ValueError, TypeError) as e:
+            # A damaged cache is just rebuilt (and overwritten) below
+            logger.warning("Ignoring unreadable path cache %s: %s", cache_path, e)
+
+    logger.info("Calculating shortest paths for %s OD pairs...", len(pairs))
     path_lookup = {}
-    G_route = network.routing_graph
 
-    # Get all nodes in the routing graph
-    all_nodes = list(G_route.nodes)
-    logger.debug(f"Routing graph has {len(all_nodes)} nodes")
+    logger.debug("Routing graph has %s nodes", len(all_nodes))
+    node_stations = [node[0] for node in all_nodes]
+
+    # Group the (Station, Line) node numbers by station once, in graph order
+    nodes_by_station = defaultdict(list)
+    for i, station in enumerate(node_stations):
+        nodes_by_station[station].append(i)
 
     # We assume passengers enter via the line that minimizes their TOTAL travel time.
     # So we look for min(path_weight) among all (Origin, L1) -> (Dest, L2).
+    # Each station gets a virtual source joined to its line nodes, and a virtual sink
+    # they all join, at zero cost. A search from the origin's source then reaches
+    # the destination's sink by exactly that minimum
+    source_of, sink_of = {}, {}
+    for station, line_nodes in nodes_by_station.items():
+        source_of[station] = len(node_stations)
+        sink_of[station] = len(node_stations) + 1
+        node_stations += [station, station]
+        for i in line_nodes:
+            rows += [source_of[station], i]
+            cols += [i, sink_of[station]]
+            weights += [0, 0]
+    # Lay the weighted edges out as a sparse matrix, for scipy's Dijkstra
+    n = len(node_stations)
+    # int32 node numbers, which csgraph uses natively (int64 indices are converted on
+    # every search). Weights stay float64, which is what it computes in
+    rows, cols = np.array(rows, dtype=np.int32), np.array(cols, dtype=np.int32)
+    graph = csr_array((weights, (rows, cols)), shape=(n, n))
+
+    # Search from whichever side has fewer distinct stations. With fewer
+    # destinations than origins, each destination is searched backwards over the
+    # reversed graph (the transposed matrix) instead, and its paths are read back
+    # the other way at the end. Reversed, sinks are where searches start
+    backward = len({d for _, d in pairs}) < len({o for o, _ in pairs})
+    if backward:
+        logger.debug("Fewer destinations than origins, searching backwards...")
+        graph = graph.T.tocsr()
+        searched_pairs = [(d, o) for o, d in pairs]
+        source_of, sink_of = sink_of, source_of
+    else:
+        searched_pairs = pairs
+
+    # Group the destinations by origin, so each origin's shortest-path search is
+    # run once and shared by all its destinations
+    dests_by_origin = defaultdict(list)
+    for origin, dest in searched_pairs:
+        dests_by_origin[origin].append(dest)
+
+    # Each task carries the node numbers it needs, so workers only need the graph
+    # itself. Stations with no nodes in the graph can't be routed
+    tasks = [
+        (
+            origin,
+            source_of[origin],
+            {dest: sink_of[dest] for dest in dests if dest in sink_of},
+        )
+        for origin, dests in dests_by_origin.items()
+        if origin in source_of
+    ]
 
-    stations = network.stations
-    total_pairs = len(stations) * (len(stations) - 1)
-    processed = 0
-
-    for origin in stations:
-        for dest in stations:
-            # Step 1: pick an origin and destination
-
-            # skip if its the same station
-            if origin == dest:
-                continue
-
-            processed += 1
-            if processed % 100 == 0:
-                logger.debug(f"Processing path {processed}/{total_pairs}...")
-
-            # Step 2: what is every possible starting and ending node in the routing
-            # graph for these two stations => (origin, RED) and (origin, YELLOW)?
-            start_nodes = [n for n in all_nodes if n[0] == origin]
-            end_nodes = [n for n in all_nodes if n[0] == dest]
-
-            best_path = None
-            min_weight = float("inf")
-
-            # Step 3: Calculate shortest path across all possible lines
-            for s_node in start_nodes:
-                for e_node in end_nodes:
-                    try:
-                        # E.g.:
-                        # shortest_path( (origin, RED) -> (destination, GREEN) ) vs.
-                        # shortest_path( (origin, RED) -> (destination, BLUE) ) vs.
-                        # ... => what's the overall shortest path?
-                        weight, path = nx.bidirectional_dijkstra(
-                            G_route, s_node, e_node, weight="weight"
-                        )
-
-                        # Set min weight and best path
-                        if weight < min_weight:
-                            min_weight = weight
-                            best_path = path
-
-                    except nx.NetworkXNoPath:
-                        continue
-
-            # Step 4: Convert shortest path which is currently Node tuples into Segments
-            if best_path:
-                segments = []
-                for i in range(len(best_path) - 1):
-                    u_node = best_path[i]
-                    v_node = best_path[i + 1]
-
-                    # If stations are different, they moved! (Travel Edge)
-                    # If stations are same, they transferred. (Transfer Edge - ignore
-                    # for capacity)
-                    if u_node[0] != v_node[0]:
-                        seg = Segment(u_node[0], v_node[0])
-                        segments.append(seg)
-
-                # Step 5: Append to our dictionary
-                path_lookup[(origin, dest)] = segments
-                logger.debug(
-                    f"Path {origin}->{dest}: {len(segments)} segments, weight {min_weight}"
-                )
-
-    logger.info(f"Path lookup complete: {len(path_lookup)} paths calculated")
+    # Origins are independent, so they can be spread over processes. Not worth the
+    # start-up cost for a handful of origins
+    if workers == -1:
+        workers = os.cpu_count() or 1
+    if workers is not None and workers > 1 and len(tasks) >= _MIN_PARALLEL_ORIGINS:
+        logger.debug("Routing %s origins on %s workers...", len(tasks), workers)
+        # forkserver: pyarrow and numpy may have threads running, which fork can't
+        # safely copy
+        ctx = mp.get_context("forkserver")
+        with ctx.Pool(
+            workers, initializer=_init_route_worker, initargs=(graph, node_stations)
+        ) as pool:
+            # imap keeps the origin order, so the lookup is the same as serially
+            for routed in pool.imap(_route_origin_task, tasks):
+                path_lookup.update(routed)
+    else:
+        for i, task in enumerate(tasks, 1):
+            path_lookup.update(_route_from_origin(graph, node_stations, *task))
+            logger.debug("Routed origin %s (%s/%s)", task[0], i, len(tasks))
+
+    if backward:
+        # A reversed path dest -> origin, flipped back, in the order pairs were given
+        path_lookup = {
+            (o, d): [Segment(seg.v, seg.u) for seg in reversed(path_lookup[d, o])]
+            for o, d in pairs
+            if (d, o) in path_lookup
+        }
+
+    # Lay the paths out over station indices: the network's stations, then any
+    # other station asked for
+    stations = dict.fromkeys(network.stations)
+    stations.update(dict.fromkeys(station for pair in pairs for station in pair))
+    station_index = {s: i for i, s in enumerate(stations)}
+    paths = np.full((len(stations), len(stations)), None, dtype=object)
+    for (origin, dest), segments in path_lookup.items():
+        paths[station_index[origin], station_index[dest]] = segments
+    path_lookup = PathLookup(stations, paths)
+
+    logger.info("Path lookup complete: %s paths calculated", len(path_lookup))
+
+    if cache_path is not None:
+        _save_path_lookup(path_lookup, cache_path)
+    memo[key] = path_lookup
     return path_lookup
 
 
@@ -183,7 +534,7 @@ def prepare_demand_data(df: pd.DataFrame, valid_stations: set) -> pd.DataFrame:
 
     Logic:
     0. Focus only on weekdays to find the maximum usage
-    1. Filter out stations not in our network.
+    1. Filter out stations not in our network, and same station exits (anomaly).
     2. Map raw hours (0-23) to our periods (AM, PM, OFF).
     3. Normalize total counts by the number of days in the dataset.
     4. Normalize by the duration of the period to get 'Passengers Per Hour'.
@@ -193,18 +544,26 @@ def prepare_demand_data(df: pd.DataFrame, valid_stations: set) -> pd.DataFrame:
 
     # 2. Filter for Weekdays ONLY (Monday=0, Sunday=6)
     # We only care about Mon-Fri for Fleet Sizing
-    df_clean = df[df["date"].dt.dayofweek < 5].copy()
-
-    # 3. Filter Data (Keep only valid stations)
-    df_clean = df_clean[
-        df_clean["origin"].isin(valid_stations) & df_clean["dest"].isin(valid_stations)
-    ]
-    # 4. Map Hours to Periods
-    hour_to_period = config.hours_to_periods()
+    # 3. Filter Data (Keep only valid stations, and skip same station exits)
+    # 4. Filter only for hours that exist in our defined periods
+    # All of these go into one mask, so the frame is copied only once
+    # Hours are looked up in a table of period codes, rather than hashed in a dict
+    period_codes = config.hour_period_codes().take(df["hour"].to_numpy(), mode="clip")
+    mask = (
+        (df["date"].dt.dayofweek < 5)
+        & df["origin"].isin(valid_stations)
+        & df["dest"].isin(valid_stations)
+        & (df["origin"] != df["dest"])
+        & (period_codes >= 0)
+    )
+    df_clean = df.loc[mask].copy()
 
-    # Filter only for hours that exist in our defined periods
-    df_clean = df_clean[df_clean["hour"].isin(hour_to_period.keys())]
-    df_clean["period"] = df_clean["hour"].map(hour_to_period)
+    # Map Hours to Periods
+    # As a categorical (in PERIOD_TO_HOURS order), so grouping and comparing periods
+    # works on small integer codes rather than strings
+    df_clean["period"] = pd.Categorical.from_codes(
+        period_codes[mask.to_numpy()], categories=list(config.PERIOD_TO_HOURS)
+    )
 
     # 5. Identify Normalization Factor (The "Days" Fix)
     # If the dataset covers 3 months (90 days), we must divide the total sum by 90.
@@ -214,16 +573,17 @@ def prepare_demand_data(df: pd.DataFrame, valid_stations: set) -> pd.DataFrame:
 
     # 6. Aggregate Total Counts
     # Sum up every single trip in the history of the file for this (O, D, Period)
+    # observed=True: only the combinations present, not every category product
     od_sums = (
-        df_clean.groupby(["origin", "dest", "period"])["count"].sum().reset_index()
+        df_clean.groupby(["origin", "dest", "period"], observed=True)["count"]
+        .sum()
+        .reset_index()
     )
 
     # 7. Calculate Hourly Rate
-    def get_period_hours(row):
-        return len(config.PERIOD_TO_HOURS[row["period"]])
-
     # First, get the number of hours in that particular period
-    od_sums["hours_in_period"] = od_sums.apply(get_period_hours, axis=1)
+    period_hours = np.array(list(config.PERIOD_HOURS.values()))
+    od_sums["hours_in_period"] = period_hours[od_sums["period"].cat.codes]
 
     # Then, normalize it by the number of hours and the number of days
     od_sums["passengers_per_hr"] = (
@@ -235,52 +595,112 @@ def prepare_demand_data(df: pd.DataFrame, valid_stations: set) -> pd.DataFrame:
     return od_sums
 
 
-def calculate_segment_demand(network: BartNetwork, df: pd.DataFrame) -> dict:
+def _paths_to_csr(
+    path_lookup: Mapping[tuple[str, str], list[Segment]],
+) -> tuple[list[Segment], np.ndarray, np.ndarray]:
+    """
+    Numbers every segment in the lookup and lays the paths out CSR-style, in lookup
+    order: path k is path_seg_ids[indptr[k] : indptr[k + 1]].
+
+    Returns:
+        (segments, indptr, path_seg_ids), where segments[i] is segment id i
+    """
+    seg_ids = {}
+    path_seg_ids = np.fromiter(
+        (
+            seg_ids.setdefault(seg, len(seg_ids))
+            for segs in path_lookup.values()
+            for seg in segs
+        ),
+        dtype=np.int32,
+    )
+    lengths = np.fromiter(
+        (len(segs) for segs in path_lookup.values()),
+        dtype=np.int64,
+        count=len(path_lookup),
+    )
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    return list(seg_ids), indptr, path_seg_ids
+
+
+def calculate_segment_demand(
+    network: BartNetwork,
+    df: pd.DataFrame,
+    path_lookup: Mapping[tuple[str, str], list[Segment]] | None = None,
+) -> dict:
     """
     Main driver function.
     1. Filters data for valid periods/stations.
-    2. Routes passengers using pre-calc paths.
+    2. Routes passengers using pre-calc paths for the OD pairs in the data.
     3. Aggregates demand onto segments.
 
+    Paths only depend on the network, so callers running several scenarios on it can
+    build a path_lookup once (see build_path_lookup) and pass it in.
+
     Returns:
         dict[(Segment, Period)] -> Total Passengers per Hour
     """
     logger.info("Starting segment demand calculation...")
 
-    # 1. Pre-calculate paths
-    logger.debug("Phase 1: Building path lookup...")
-    path_lookup = build_path_lookup(network)
-
-    # 2. Get data as Origin-Destination total demand
-    logger.debug("Phase 2: Preparing demand data...")
+    # 1. Get data as Origin-Destination total demand
+    logger.debug("Phase 1: Preparing demand data...")
     valid_stations = network.station_set
     od_sums = prepare_demand_data(df, valid_stations)
-    logger.info(f"Prepared demand data: {len(od_sums)} OD pairs with demand")
+    logger.info("Prepared demand data: %s OD pairs with demand", len(od_sums))
+
+    # 2. Pre-calculate paths, only for the OD pairs that riders actually take
+    if path_lookup is None:
+        logger.debug("Phase 2: Building path lookup...")
+        path_lookup = build_path_lookup(
+            network,
+            cache_dir=config.DATA_DIR,
+            pairs=zip(od_sums["origin"], od_sums["dest"]),
+        )
 
     # 3. Convert OD to Segment specific demand
     logger.debug("Phase 3: Routing demand to segments...")
-    segment_demand = defaultdict(float)
-    total_passengers = 0
-
-    for row in od_sums.itertuples():
-        # skip same station exits (anomaly)
-        if row.origin == row.dest:
-            continue
+    segments, indptr, path_seg_ids = _paths_to_csr(path_lookup)
 
-        path_segments = path_lookup.get((row.origin, row.dest))
-
-        if path_segments:
-            for seg in path_segments:
-                # for each segment, increment the demand
-                segment_demand[(seg, row.period)] += row.passengers_per_hr
-            total_passengers += row.passengers_per_hr
-        else:
-            # Handle edge case where no path found (shouldn't happen in valid graph)
-            logger.error(f"No shortest path found for {row.origin} -> {row.dest}")
-            raise nx.NetworkXNoPath(f"No shortest path for {row.origin} -> {row.dest}")
+    # Which path (row of the CSR layout) each OD row travels on; -1 if none
+    path_index = pd.MultiIndex.from_tuples(list(path_lookup), names=["origin", "dest"])
+    path_of = path_index.get_indexer(
+        pd.MultiIndex.from_arrays([od_sums["origin"], od_sums["dest"]])
+    )
+    if (path_of < 0).any():
+        # Handle edge case where no path found (shouldn't happen in valid graph)
+        origin, dest = od_sums.iloc[np.argmax(path_of < 0)][["origin", "dest"]]
+        logger.error("No shortest path found for %s -> %s", origin, dest)
+        raise nx.NetworkXNoPath(f"No shortest path for {origin} -> {dest}")
+
+    # Expand every OD row over its path, giving one (segment id, rate, period) entry
+    # per segment travelled: row r's entries are path_seg_ids[start_r : start_r + len_r]
+    lengths = np.diff(indptr)[path_of]
+    rows = np.repeat(np.arange(len(path_of)), lengths)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    ids = path_seg_ids[indptr[path_of][rows] + offsets]
+    pax = od_sums["passengers_per_hr"].to_numpy()[rows]
+    periods = od_sums["period"].cat.codes.to_numpy()[rows]
+
+    # for each segment, add up the demand of every OD pair routed over it: one
+    # bincount over flat (period, segment id) indices fills a periods x segments grid
+    period_names = od_sums["period"].cat.categories
+    n_cells = len(period_names) * len(segments)
+    cell = periods.astype(np.int64) * len(segments) + ids
+    totals = np.bincount(cell, weights=pax, minlength=n_cells)
+    used = np.flatnonzero(np.bincount(cell, minlength=n_cells))
+    used_periods, used_ids = np.divmod(used, len(segments))
+    keys = (
+        (segments[i], period_names[p])
+        for p, i in zip(used_periods.tolist(), used_ids.tolist())
+    )
+    segment_demand = dict(zip(keys, totals[used].tolist()))
+    total_passengers = od_sums["passengers_per_hr"].sum()
 
     logger.info(
-        f"Segment demand calculation complete: {len(segment_demand)} segment-period pairs"
+        "Segment demand calculation complete: %s segment-period pairs",
+        len(segment_demand),
+    )
+    logger.info(
+        "Total demand routed: %s passengers/hour", format(total_passengers, ",.0f")
     )
-    logger.info(f"Total demand routed: {total_passengers:,.0f} passengers/hour")
-    return dict(segment_demand)
+    return segment_demand
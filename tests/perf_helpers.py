@@ -0,0 +1,39 @@
+import networkx as nx
+
+
+def make_grid_network(stations: int = 200, lines: int = 4):
+    """
+    Builds a synthetic routing graph, much larger than the toy network, for
+    benchmarking.
+
+    Every line runs through every station, each in its own order (line k visits
+    station i at position i * (2k + 1) mod stations), so every station is a transfer
+    station and there are many competing routes.
+
+    Returns:
+        (routing_graph, station names), the same shape that MockBartNetwork takes
+    """
+    names = [f"S{i:03d}" for i in range(stations)]
+
+    travel = nx.Graph()
+    for k in range(lines):
+        line = f"L{k}"
+        order = sorted(range(stations), key=lambda i: (i * (2 * k + 1)) % stations)
+        travel.add_edges_from(
+            (((names[a], line), (names[b], line)) for a, b in zip(order, order[1:])),
+            weight=1.0,
+        )
+    G = travel.to_directed()
+
+    # Transfers between every ordered pair of lines at every station
+    G.add_edges_from(
+        (
+            ((name, f"L{k1}"), (name, f"L{k2}"))
+            for name in names
+            for k1 in range(lines)
+            for k2 in range(lines)
+            if k1 != k2
+        ),
+        weight=4.0,
+    )
+    return G, names
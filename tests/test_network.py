@@ -0,0 +1,67 @@
+import pickle
+
+import pytest
+from scipy.sparse import csr_matrix
+
+import src.config as config
+from src.network import UNREACHABLE, BartNetwork
+
+
+@pytest.fixture(scope="module")
+def network():
+    return BartNetwork()
+
+
+def test_distance_counts_stops(network):
+    """Along one line, the distance is the number of stops travelled."""
+    # Ashby -> Macarthur -> 19th St
+    assert network.distance(("ASHB", "RED"), ("19TH", "RED")) == 2
+    assert network.distance(("19TH", "RED"), ("ASHB", "RED")) == 2
+
+
+def test_distance_adds_transfer_penalty(network):
+    """Changing lines costs TRANSFER_PENALTY_EDGES on top of the stops."""
+    assert network.distance(("MCAR", "RED"), ("MCAR", "YELLOW")) == (
+        config.TRANSFER_PENALTY_EDGES
+    )
+    assert network.distance(("ASHB", "RED"), ("19TH", "YELLOW")) == (
+        2 + config.TRANSFER_PENALTY_EDGES
+    )
+
+
+def test_distance_unreachable():
+    """Nodes with no path between them are UNREACHABLE in the int16 table."""
+    # A bare network, with a one-way A -> B edge and C on its own
+    net = BartNetwork.__new__(BartNetwork)
+    net.routing_nodes = [("A", "RED"), ("B", "RED"), ("C", "BLUE")]
+    net.node_ids = {node: i for i, node in enumerate(net.routing_nodes)}
+    net.routing_csr = csr_matrix(([1.0], ([0], [1])), shape=(3, 3))
+
+    assert net.distance(("A", "RED"), ("B", "RED")) == 1
+    assert net.distance(("B", "RED"), ("A", "RED")) == UNREACHABLE
+    assert net.distance(("A", "RED"), ("C", "BLUE")) == UNREACHABLE
+
+
+def test_dist_is_lazy():
+    """The all-pairs table is only computed once something asks for it."""
+    net = BartNetwork()
+    assert "dist" not in vars(net)
+
+    net.distance(("ASHB", "RED"), ("MCAR", "RED"))
+    assert "dist" in vars(net)
+
+
+def test_damaged_layout_cache_is_recomputed(tmp_path, monkeypatch):
+    """A truncated layout pickle is recomputed and rewritten, not fatal."""
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path)
+    pos = BartNetwork().pos
+    (cache_file,) = tmp_path.glob("layout-*.pkl")
+    cache_file.write_bytes(cache_file.read_bytes()[:10])
+
+    recomputed = BartNetwork().pos
+
+    assert recomputed.keys() == pos.keys()
+    # and the file was rewritten whole
+    with open(cache_file, "rb") as f:
+        assert pickle.load(f).keys() == pos.keys()
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,75 @@
+import pytest
+
+import src.config as config
+from src.network import Segment
+
+# The size-limited license that ships with gurobipy is plenty for these models
+pytest.importorskip("gurobipy")
+from src.optimize import run_optimization  # noqa: E402
+
+
+def schedule_cost(schedule):
+    """Car-hours of a schedule, the same cost the optimizer minimizes."""
+    return sum(
+        count * size * config.ROUND_TRIP_HOURS[line] * config.PERIOD_HOURS[period]
+        for (line, period, size), count in schedule.items()
+    )
+
+
+def schedule_capacity(schedule, seg, period):
+    """Passengers per hour a schedule carries over one segment in one period."""
+    return sum(
+        count * size * config.CAP_PER_CAR
+        for (line, p, size), count in schedule.items()
+        if p == period and line in config.SEGMENT_TO_LINES[seg]
+    )
+
+
+# The cheapest feasible schedule: every line at the minimum frequency, with the
+# shortest trains, in every period
+MIN_COST = sum(
+    config.MIN_FREQ
+    * min(config.POSSIBLE_TRAIN_LENGTHS)
+    * config.ROUND_TRIP_HOURS[line]
+    * config.PERIOD_HOURS[period]
+    for line in config.LINES
+    for period in config.PERIOD_TO_HOURS
+)
+
+
+def test_minimum_service_covers_small_demand():
+    """Demand the minimum service already carries costs nothing extra."""
+    demand = {
+        (Segment("ASHB", "MCAR"), "AM"): 500.0,
+        (Segment("DALY", "BALB"), "PM"): 300.0,
+    }
+    schedule = run_optimization(demand)
+
+    for (seg, period), pax in demand.items():
+        assert schedule_capacity(schedule, seg, period) >= pax
+    assert schedule_cost(schedule) == pytest.approx(MIN_COST)
+
+
+def test_extra_demand_bought_at_least_cost():
+    """Demand over the minimum service is met by the cheapest extra car."""
+    # RED and ORANGE both run ASHB -> MCAR; at the minimum that's 2 lines x 2 trains
+    # x 3 cars x 150 = 1800 pax/hr. 100 more needs one more car on one train, and
+    # ORANGE has the shorter round trip
+    demand = {
+        (Segment("ASHB", "MCAR"), "AM"): 1900.0,
+        (Segment("DALY", "BALB"), "PM"): 300.0,
+    }
+    schedule = run_optimization(demand)
+
+    for (seg, period), pax in demand.items():
+        assert schedule_capacity(schedule, seg, period) >= pax
+    extra = config.ROUND_TRIP_HOURS["ORANGE"] * config.PERIOD_HOURS["AM"]
+    assert schedule_cost(schedule) == pytest.approx(MIN_COST + extra)
+
+
+def test_unserved_segment_raises():
+    """A segment no line runs over can't be given capacity."""
+    demand = {(Segment("ANTC", "DALY"), "AM"): 100.0}
+
+    with pytest.raises(ValueError, match="not served"):
+        run_optimization(demand)
@@ -1,23 +1,36 @@
+import pickle
+import weakref
+from collections.abc import ItemsView, ValuesView
+from dataclasses import dataclass, field
+from itertools import permutations
+
 import networkx as nx
+import pandas as pd
 import pytest
 
-from src.network import Segment
-from src.routing import build_path_lookup
+import src.config as config
+from perf_helpers import make_grid_network
+from src.network import BartNetwork, Segment
+from src import routing
+from src.routing import build_path_lookup, calculate_segment_demand
 
 
 # 1. Mock Infrastructure
+@dataclass(slots=True)
 class MockBartNetwork:
     """A tiny fake network to isolate the routing logic."""
 
-    def __init__(self, routing_graph, stations):
-        self.routing_graph = routing_graph
-        self.stations = stations
-        # The routing logic expects a station_set for filtering, though
-        # build_path_lookup mainly uses self.stationsp
-        self.station_set = set(stations)
+    routing_graph: nx.DiGraph
+    stations: list[str]
+    # The routing logic expects a station_set for filtering, though
+    # build_path_lookup mainly uses self.stations
+    station_set: frozenset[str] = field(init=False)
+
+    def __post_init__(self):
+        self.station_set = frozenset(self.stations)
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def toy_network():
     """
     Creates a 'T-shaped' network to test direct travel and transfers.
@@ -29,45 +42,51 @@ def toy_network():
     Stations: A, B, C, D
     Transfer Station: B (Passengers must switch RED <-> BLUE to go A->D)
     """
-    G = nx.DiGraph()
-
     # --- 1. Travel Edges (Bidirectional) ---
-    # RED Line: A <-> B <-> C
+    # Travel costs the same both ways, so each track edge is listed once on an
+    # undirected graph, and to_directed gives the routing graph both directions
     # Weights are 1.0 for travel
-    edges = [
-        # (Station, Line) -> (Station, Line)
-        (("A", "RED"), ("B", "RED")),
-        (("B", "RED"), ("A", "RED")),
-        (("B", "RED"), ("C", "RED")),
-        (("C", "RED"), ("B", "RED")),
-        # BLUE Line: B <-> D
-        (("B", "BLUE"), ("D", "BLUE")),
-        (("D", "BLUE"), ("B", "BLUE")),
-    ]
-    for u, v in edges:
-        G.add_edge(u, v, weight=1.0)
+    travel = nx.Graph()
+    travel.add_edges_from(
+        [
+            # (Station, Line) <-> (Station, Line)
+            # RED Line: A <-> B <-> C
+            (("A", "RED"), ("B", "RED")),
+            (("B", "RED"), ("C", "RED")),
+            # BLUE Line: B <-> D
+            (("B", "BLUE"), ("D", "BLUE")),
+        ],
+        weight=1.0,
+    )
+    G = travel.to_directed()
 
     # --- 2. Transfer Edges (At Station B) ---
     # Cost = 4.0 (Penalty)
-    # Connect (B, RED) <-> (B, BLUE)
-    G.add_edge(("B", "RED"), ("B", "BLUE"), weight=4.0)
-    G.add_edge(("B", "BLUE"), ("B", "RED"), weight=4.0)
+    # Every ordered pair of lines at B, as BartNetwork does: (B, RED) <-> (B, BLUE)
+    G.add_edges_from(
+        ((("B", l1), ("B", l2)) for l1, l2 in permutations(["RED", "BLUE"], 2)),
+        weight=4.0,
+    )
 
     stations = ["A", "B", "C", "D"]
     return MockBartNetwork(G, stations)
 
 
+@pytest.fixture(scope="module")
+def toy_lookup(toy_network):
+    """The toy network's full path lookup, built once and shared (read-only)."""
+    return build_path_lookup(toy_network)
+
+
 # ------------------------------------------------------------------
 # 2. The Tests
 # ------------------------------------------------------------------
 
 
-def test_direct_route(toy_network):
+def test_direct_route(toy_lookup):
     """Test A -> C (Same Line). Should have no transfers."""
-    lookup = build_path_lookup(toy_network)
-
     # Path: A -> B -> C
-    segments = lookup[("A", "C")]
+    segments = toy_lookup[("A", "C")]
     print(segments)
 
     assert len(segments) == 2
@@ -75,13 +94,11 @@ def test_direct_route(toy_network):
     assert segments[1] == Segment("B", "C")
 
 
-def test_transfer_route(toy_network):
+def test_transfer_route(toy_lookup):
     """Test A -> D (Red to Blue). Must transfer at B."""
-    lookup = build_path_lookup(toy_network)
-
     # Path: A(Red) -> B(Red) --Transfer--> B(Blue) -> D(Blue)
     # The 'Segment' list should only capture physical moves: A->B, B->D
-    segments = lookup[("A", "D")]
+    segments = toy_lookup[("A", "D")]
 
     assert len(segments) == 2
     assert segments[0] == Segment("A", "B")
@@ -90,29 +107,40 @@ def test_transfer_route(toy_network):
     # and should NOT appear in the physical segments list.
 
 
-def test_completeness(toy_network):
+def test_completeness(toy_network, toy_lookup):
     """
     CRITICAL: Ensure that for N stations, we generate exactly
     N*(N-1) paths. Every possible pair must exist.
     """
-    lookup = build_path_lookup(toy_network)
-
     stations = toy_network.stations
-    missing_pairs = []
-
-    for origin in stations:
-        for dest in stations:
-            if origin == dest:
-                continue
-
-            if (origin, dest) not in lookup:
-                missing_pairs.append(f"{origin}->{dest}")
+    expected = set(permutations(stations, 2))
+    missing_pairs = expected - toy_lookup.keys()
 
     assert not missing_pairs, (
-        f"Build Path Lookup failed to generate paths for: {missing_pairs}"
+        f"Build Path Lookup failed to generate paths for: {sorted(missing_pairs)}"
     )
 
 
+def test_lookup_by_station_index(toy_lookup):
+    """The lookup's array holds the same paths, at the stations' indices."""
+    i, j = toy_lookup.station_index["A"], toy_lookup.station_index["C"]
+
+    assert toy_lookup.paths[i, j] == toy_lookup[("A", "C")]
+    assert toy_lookup.paths[i, i] is None
+    with pytest.raises(KeyError):
+        toy_lookup[("A", "A")]
+
+
+def test_lookup_views(toy_lookup):
+    """values() and items() are Mapping views, in the lookup's iteration order."""
+    assert isinstance(toy_lookup.values(), ValuesView)
+    assert isinstance(toy_lookup.items(), ItemsView)
+    assert len(toy_lookup.values()) == len(toy_lookup) == 12
+
+    assert list(toy_lookup.items()) == [(pair, toy_lookup[pair]) for pair in toy_lookup]
+    assert (("A", "C"), toy_lookup[("A", "C")]) in toy_lookup.items()
+
+
 def test_impossible_route():
     """Test disconnected graph behavior."""
     G = nx.DiGraph()
@@ -126,3 +154,131 @@ def test_impossible_route():
     assert ("A", "B") in lookup
     # A->C does NOT exist
     assert ("A", "C") not in lookup
+
+
+def test_requested_pairs(toy_network):
+    """Only requested pairs are routed; repeats and same-station pairs are dropped."""
+    lookup = build_path_lookup(
+        toy_network, pairs=[("A", "D"), ("C", "B"), ("A", "D"), ("B", "B")]
+    )
+
+    assert list(lookup) == [("A", "D"), ("C", "B")]
+    assert lookup[("C", "B")] == [Segment("C", "B")]
+
+
+def test_backward_lookup(toy_network, toy_lookup):
+    """Pairs with fewer destinations than origins are routed backwards, same paths."""
+    pairs = [("A", "D"), ("C", "D"), ("D", "A"), ("C", "A")]
+
+    assert build_path_lookup(toy_network, pairs=pairs) == {
+        p: toy_lookup[p] for p in pairs
+    }
+
+
+def test_memo_per_station_list(toy_network):
+    """Networks sharing a routing graph but not their stations get their own lookups."""
+    G = toy_network.routing_graph
+    two = build_path_lookup(MockBartNetwork(G, ["A", "B"]))
+    three = build_path_lookup(MockBartNetwork(G, ["A", "B", "C"]))
+
+    assert list(two) == [("A", "B"), ("B", "A")]
+    assert len(three) == 6
+    assert three[("A", "C")] == [Segment("A", "B"), Segment("B", "C")]
+
+
+def test_parallel_lookup(toy_network, toy_lookup, monkeypatch):
+    """Routing origins in a process pool gives the same lookup as serially."""
+    # the toy network is far below the size where the pool kicks in, and its lookup
+    # is already memoized
+    monkeypatch.setattr(routing, "_MIN_PARALLEL_ORIGINS", 0)
+    monkeypatch.setattr(routing, "_LOOKUP_MEMO", weakref.WeakKeyDictionary())
+
+    assert build_path_lookup(toy_network, workers=2) == toy_lookup
+
+    # -1 means one worker per core
+    routing._LOOKUP_MEMO.clear()
+    assert build_path_lookup(toy_network, workers=-1) == toy_lookup
+
+
+def test_cached_lookup(toy_network, tmp_path):
+    """A second build on the same graph loads the pickled lookup from cache_dir."""
+    lookup = build_path_lookup(toy_network, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("paths-*.pkl"))) == 1
+
+    assert build_path_lookup(toy_network, cache_dir=tmp_path) == lookup
+
+
+def test_cache_per_station_list(toy_network, tmp_path):
+    """The disk cache doesn't hand one station list's lookup to another."""
+    # fresh copies of the graph each time, so only the disk cache could be reused
+    G = toy_network.routing_graph
+    build_path_lookup(MockBartNetwork(G.copy(), ["A", "B"]), cache_dir=tmp_path)
+    lookup = build_path_lookup(
+        MockBartNetwork(G.copy(), ["A", "B", "C"]), cache_dir=tmp_path
+    )
+
+    assert len(lookup) == 6
+    assert len(list(tmp_path.glob("paths-*.pkl"))) == 2
+
+
+def test_damaged_cache_is_rebuilt(toy_network, toy_lookup, tmp_path, monkeypatch):
+    """A truncated cache file (say, from an interrupted write) is rebuilt, not fatal."""
+    build_path_lookup(toy_network, cache_dir=tmp_path)
+    (cache_file,) = tmp_path.glob("paths-*.pkl")
+    cache_file.write_bytes(cache_file.read_bytes()[:10])
+    # a new session, so the build goes to the cache file
+    monkeypatch.setattr(routing, "_LOOKUP_MEMO", weakref.WeakKeyDictionary())
+
+    assert build_path_lookup(toy_network, cache_dir=tmp_path) == toy_lookup
+    # and the file was rewritten whole
+    with open(cache_file, "rb") as f:
+        assert routing.PathLookup(*pickle.load(f)) == toy_lookup
+
+
+def test_segment_demand(toy_network, toy_lookup, tmp_path, monkeypatch):
+    """OD demand lands on every physical segment of its path, summed per period."""
+    # keep the path cache out of the real data dir
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path)
+    # 2024-01-01 is a Monday; AM is 4 hours long, so 40 trips -> 10 pax/hr
+    df = pd.DataFrame(
+        {
+            "date": ["2024-01-01"] * 4,
+            "hour": [7, 7, 7, 7],
+            "origin": ["A", "A", "C", "B"],
+            "dest": ["C", "D", "C", "A"],
+            "count": [40, 80, 999, 4],
+        }
+    )
+    demand = calculate_segment_demand(toy_network, df)
+
+    assert demand == {
+        (Segment("A", "B"), "AM"): 30.0,
+        (Segment("B", "C"), "AM"): 10.0,
+        (Segment("B", "D"), "AM"): 20.0,
+        (Segment("B", "A"), "AM"): 1.0,
+    }
+
+    # a lookup built ahead of time (as the stress test does) gives the same demand
+    assert calculate_segment_demand(toy_network, df, toy_lookup) == demand
+
+
+def test_bart_network_csr_lookup():
+    """BartNetwork's CSR routing graph gives the same lookup as its NetworkX copy."""
+    net = BartNetwork()
+    lookup = build_path_lookup(net)
+
+    assert "routing_graph" not in vars(net)
+    assert lookup == build_path_lookup(MockBartNetwork(net.routing_graph, net.stations))
+
+
+def test_perf_large(benchmark):
+    """Times the full lookup on a 200-station, 4-line synthetic network."""
+    G, stations = make_grid_network(stations=200, lines=4)
+    net = MockBartNetwork(G, stations)
+
+    # forget the lookup before each round, or the later rounds just time the memo
+    lookup = benchmark.pedantic(
+        build_path_lookup, args=(net,), setup=routing._LOOKUP_MEMO.clear, rounds=3
+    )
+
+    assert len(lookup) == len(stations) * (len(stations) - 1)